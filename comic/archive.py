@@ -0,0 +1,165 @@
+import argparse
+import logging
+import mimetypes
+import mmap
+import os
+import struct
+import zipfile
+
+from aiohttp import web
+
+from comic.library import FILE, IMAGE_CACHE_CONTROL, PAGE_CACHE_CONTROL, ComicSite, library_metadata
+
+
+log = logging.getLogger(__name__)
+
+LOCAL_HEADER = struct.Struct('<4s22xHH')
+LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+
+
+def series_files(folder):
+    ## Metadata first so it sits at the front of the pack; then the images.
+    if os.path.isfile(os.path.join(folder, '.data.yaml')):
+        yield '.data.yaml'
+    images_folder = os.path.join(folder, 'images')
+    if os.path.isdir(images_folder):
+        for name in sorted(os.listdir(images_folder)):
+            yield 'images/' + name
+
+
+def export_series(folders, archive_path, library=None):
+    ## Each series is stored under its folder name. Images are already compressed;
+    ## storing them uncompressed lets readers slice them straight out of the file.
+    library = library or {}
+    with zipfile.ZipFile(archive_path, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for folder in folders:
+            series_name = os.path.basename(os.path.normpath(folder))
+            count = 0
+            for name in series_files(folder):
+                archive.write(os.path.join(folder, name), series_name + '/' + name)
+                count += 1
+            data_file = os.path.join(folder, '.data.yaml')
+            if os.path.isfile(data_file):
+                ## The crawl no longer writes index.html; so render it for the pack.
+                comic_site = ComicSite(library.get(series_name, {'name': series_name}), {}, {})
+                comic_site.load_file(data_file)
+                archive.writestr(series_name + '/index.html', comic_site.render_html())
+            log.info("Packed %d files from %s into %s", count, folder, archive_path)
+
+
+def import_series(archive_path, library_folder):
+    with zipfile.ZipFile(archive_path) as archive:
+        archive.extractall(library_folder)
+    log.info("Unpacked %s into %s", archive_path, library_folder)
+
+
+class ComicPack():
+
+    def __init__(self, archive_path):
+        self.archive_path = archive_path
+        self._file = open(archive_path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._index = {}
+        with zipfile.ZipFile(self._file) as archive:
+            for info in archive.infolist():
+                if info.compress_type != zipfile.ZIP_STORED:
+                    raise ValueError("%s in %s is compressed; packs must be stored uncompressed." % (info.filename, archive_path))
+                signature, name_length, extra_length = LOCAL_HEADER.unpack_from(self._mmap, info.header_offset)
+                if signature != LOCAL_HEADER_SIGNATURE:
+                    raise ValueError("Bad local header for %s in %s" % (info.filename, archive_path))
+                start = info.header_offset + LOCAL_HEADER.size + name_length + extra_length
+                self._index[info.filename] = (start, info.file_size, info.CRC)
+        self._series = {name.partition('/')[0] for name in self._index}
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def names(self):
+        return list(self._index)
+
+    def series(self):
+        return sorted(self._series)
+
+    def has_series(self, name):
+        return name in self._series
+
+    def etag(self, name):
+        ## The CRC and size from the zip's directory identify the entry's content without reading it.
+        _, size, crc = self._index[name]
+        return '"%08x-%d"' % (crc, size)
+
+    def read(self, name):
+        ## The returned view points into the mapped file; it must be released before close().
+        start, size, _ = self._index[name]
+        return memoryview(self._mmap)[start:start + size]
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+async def handle_pack_redirect(request):
+    ## Relative image links in a series' page only resolve under /name/.
+    name = request.match_info['name']
+    if not any(pack.has_series(name) for pack in request.app['packs']):
+        raise web.HTTPNotFound()
+    raise web.HTTPMovedPermanently('/%s/' % (name, ))
+
+
+async def handle_pack_file(request):
+    name = request.match_info['name']
+    path = name + '/' + (request.match_info['path'] or 'index.html')
+    for pack in request.app['packs']:
+        if path in pack:
+            cache_control = IMAGE_CACHE_CONTROL if path.startswith(name + '/images/') else PAGE_CACHE_CONTROL
+            headers = {'ETag': pack.etag(path), 'Cache-Control': cache_control}
+            if request.headers.get('If-None-Match') == headers['ETag']:
+                return web.Response(status=304, headers=headers)
+            content_type, _ = mimetypes.guess_type(path)
+            return web.Response(body=pack.read(path), content_type=content_type or 'application/octet-stream',
+                                headers=headers)
+    raise web.HTTPNotFound()
+
+
+async def close_packs(app):
+    for pack in app['packs']:
+        pack.close()
+
+
+def make_pack_app(archive_paths):
+    app = web.Application()
+    app['packs'] = [ComicPack(archive_path) for archive_path in archive_paths]
+    app.on_cleanup.append(close_packs)
+    app.router.add_route('GET', '/{name}', handle_pack_redirect)
+    app.router.add_route('GET', '/{name}/{path:.*}', handle_pack_file)
+    return app
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Pack comic series into a single archive; and back again.')
+    subparsers = parser.add_subparsers(dest='command')
+    export_parser = subparsers.add_parser('export', help='Pack one or more series folders into an archive.')
+    export_parser.add_argument('archive')
+    export_parser.add_argument('folders', nargs='+')
+    import_parser = subparsers.add_parser('import', help='Unpack an archive into the library folder.')
+    import_parser.add_argument('archive')
+    import_parser.add_argument('folder')
+    serve_parser = subparsers.add_parser('serve', help='Serve packed series without unpacking them.')
+    serve_parser.add_argument('archives', nargs='+')
+    serve_parser.add_argument('--port', type=int, default=8080)
+    args = parser.parse_args()
+    if args.command == 'export':
+        export_series(args.folders, args.archive, library_metadata(FILE) if os.path.isfile(FILE) else None)
+    elif args.command == 'import':
+        import_series(args.archive, args.folder)
+    elif args.command == 'serve':
+        web.run_app(make_pack_app(args.archives), port=args.port)
+    else:
+        parser.print_help()
@@ -0,0 +1,192 @@
+import asyncio
+from collections import deque
+import logging
+import time
+from urllib.parse import urlsplit
+
+
+log = logging.getLogger(__name__)
+
+## Fraction of failed requests in a window that halves the limit.
+ERROR_RATE_LIMIT = 0.05
+## How much costlier than the baseline a window can be before it counts as slow.
+LATENCY_FACTOR = 2.0
+## Fraction of the recent throughput that counts as holding up.
+THROUGHPUT_FACTOR = 0.9
+## How much the baseline rises each window; so one early window of cheap responses doesn't set the bar forever.
+BASELINE_DECAY = 1.1
+## How much more throughput an increase has to bring for it to be kept.
+GROWTH_GAIN = 1.1
+## Windows to wait after an increase that didn't pay off before trying another.
+PROBE_COOLDOWN = 4
+MIN_WINDOW = 16
+
+
+class HostLimit():
+
+    def __init__(self, name, host, initial, minimum, maximum):
+        self.name = name
+        self.host = host
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.active = 0
+        ## Recent best cost; seconds per KiB, or per request for responses without a size.
+        self.baseline = None
+        ## Smoothed throughput of recent windows in bytes per second.
+        self.throughput = None
+        ## The smoothed throughput before the last increase; while that increase is being judged.
+        self._probe_from = None
+        self._cooldown = 0
+        self._waiters = deque()
+        self._reset_window()
+
+    def _reset_window(self):
+        self._window_start = time.perf_counter()
+        self._completed = 0
+        self._errors = 0
+        self._seconds = 0.0
+        self._bytes = 0
+        self._saturated = False
+
+    async def acquire(self):
+        while self.active >= self.limit:
+            waiter = asyncio.Future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                elif not waiter.cancelled():
+                    ## We were woken but won't use the slot; pass it on.
+                    self._wake()
+                raise
+        self.active += 1
+        if self.active >= self.limit:
+            self._saturated = True
+
+    def abandon(self):
+        ## Gives back a slot that was acquired but never used; without counting it as a request.
+        self.active -= 1
+        self._wake()
+
+    def release(self, seconds, nbytes, failed):
+        self.active -= 1
+        self._completed += 1
+        self._seconds += seconds
+        self._bytes += nbytes
+        if failed:
+            self._errors += 1
+        if self._completed >= max(self.limit, MIN_WINDOW):
+            self._adjust()
+        self._wake()
+
+    def _wake(self):
+        free = self.limit - self.active
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    def _adjust(self):
+        latency = self._seconds / self._completed
+        ## Big images take longer than small ones; so compare the time per KiB rather than per request.
+        cost = self._seconds / (self._bytes / 1024) if self._bytes else latency
+        error_rate = self._errors / self._completed
+        throughput = self._bytes / max(time.perf_counter() - self._window_start, 1e-6)
+        throughput_held = self.throughput is None or throughput >= self.throughput * THROUGHPUT_FACTOR
+        probe_from, self._probe_from = self._probe_from, None
+        slow = self.baseline is not None and cost > self.baseline * LATENCY_FACTOR
+        old_limit = self.limit
+        if error_rate > ERROR_RATE_LIMIT:
+            reason = 'errors'
+            self.limit = max(self.minimum, self.limit // 2)
+        elif slow and not throughput_held:
+            reason = 'latency'
+            self.limit = max(self.minimum, self.limit // 2)
+        elif slow:
+            ## Requests are slower but as much is coming through; the host's bandwidth is shared out, not lost.
+            reason = 'bandwidth'
+        elif not self._saturated:
+            reason = 'unsaturated'
+        elif probe_from is not None and throughput < probe_from * GROWTH_GAIN:
+            ## The last increase didn't bring more data in; so undo it and hold off probing for a while.
+            reason = 'plateau'
+            self.limit = max(self.minimum, self.limit - 1)
+            self._cooldown = PROBE_COOLDOWN
+        elif not throughput_held:
+            reason = 'throughput'
+        elif self._cooldown:
+            reason = 'cooldown'
+            self._cooldown -= 1
+        elif self.limit < self.maximum:
+            reason = 'healthy'
+            self._probe_from = self.throughput if self.throughput is not None else throughput
+            self.limit += 1
+        else:
+            reason = 'maximum'
+        if error_rate <= ERROR_RATE_LIMIT:
+            self.baseline = cost if self.baseline is None else min(cost, self.baseline * BASELINE_DECAY)
+        self.throughput = throughput if self.throughput is None else (self.throughput + throughput) / 2
+        log.info("%s limit for %s: %d -> %d (%s; latency %.3fs, %.4fs/KiB, errors %.0f%%, %.1f KiB/s)",
+                 self.name, self.host, old_limit, self.limit, reason, latency, cost, error_rate * 100, throughput / 1024)
+        self._reset_window()
+
+
+class Slot():
+
+    def __init__(self, host_limit, total=None):
+        self.host_limit = host_limit
+        self.total = total
+        self.bytes = 0
+        self.failed = False
+
+    def record_bytes(self, nbytes):
+        self.bytes += nbytes
+
+    def record_failure(self):
+        ## For responses that didn't raise but still mean the host is struggling; like a 429 or 503.
+        self.failed = True
+
+    async def __aenter__(self):
+        ## The host's slot comes first; so requests queued on one slow host don't hold total slots other hosts could use.
+        await self.host_limit.acquire()
+        if self.total is not None:
+            try:
+                await self.total.acquire()
+            except:
+                self.host_limit.abandon()
+                raise
+        self._start = time.perf_counter()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self.total is not None:
+            self.total.release()
+        failed = self.failed or (exc_type is not None and not issubclass(exc_type, asyncio.CancelledError))
+        self.host_limit.release(time.perf_counter() - self._start, self.bytes, failed)
+
+
+class AdaptiveLimit():
+
+    ## Grows each host's concurrency by one while it stays healthy and halves it on errors or rising latency.
+    ## total caps the requests in flight across every host; so a library spread over many hosts can't open a socket per slot.
+    def __init__(self, name, initial=4, minimum=1, maximum=32, total=None):
+        self.name = name
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.total = total
+        self._total = None
+        self.hosts = {}
+
+    def slot(self, url):
+        host = urlsplit(url).netloc
+        if host not in self.hosts:
+            self.hosts[host] = HostLimit(self.name, host, self.initial, self.minimum, self.maximum)
+        if self.total is not None and self._total is None:
+            ## Made on first use so it belongs to the running loop.
+            self._total = asyncio.Semaphore(self.total)
+        return Slot(self.hosts[host], self._total)
@@ -1,3 +1,4 @@
+import argparse
 import asyncio
 # from collections import namedtuple, OrderedDict
 # from contextlib import closing
@@ -7,34 +8,43 @@ import logging
 import os
 import signal
 
-from yaml import safe_load
-
 from comic.parsers import ComicParser
 from comic.utils import to_folder_name
-from comic.loader import ComicDownloader
-from comic.objects import FutureList
+from comic.library import FILE, comic_metadata
+from comic.loader import ComicDownloader, image_fetcher, state_load_times
+from comic.objects import FutureList, load_yaml
 from comic.guess import ComicGuesser
+from comic.profiling import profiler
 
 
-FILE = 'comics.yaml'
-
 log = logging.getLogger(__name__)
 logging.basicConfig(level=logging.DEBUG)
 
-async def load_comics(comics, comic_presets, comic_mixins):
+async def crawl_series(downloader, series_limit=None):
+    ## Each series' state is loaded in a worker thread as its crawl starts; series_limit optionally caps how many
+    ## are crawled, and so held in memory, at once.
+    if series_limit is None:
+        await downloader.load_comics()
+        return
+    async with series_limit:
+        await downloader.load_comics()
+
+
+def log_state_load_times(count=10):
+    slowest = sorted(state_load_times.items(), key=lambda item: -item[1])[:count]
+    if slowest:
+        log.info("Loaded %d state files in %.3fs. Slowest:", len(state_load_times), sum(state_load_times.values()))
+    for config_file, seconds in slowest:
+        log.info("  %.3fs %s", seconds, config_file)
+
+
+async def load_comics(comics, comic_presets, comic_mixins, update_only=False, series_limit=None):
     comic_parsers = FutureList()
+    series_limit = asyncio.Semaphore(series_limit) if series_limit else None
     for name, comic in comics.items():
-        metadata = comic.get('meta', {})
-        for meta_keys in ['name', 'layout', 'folder', 'initialurl']:
-            if meta_keys in comic and meta_keys not in metadata:
-                metadata[meta_keys] = comic[meta_keys]
-        metadata.setdefault('name', name)
-        if metadata.get('layout') not in ('horizontal', 'vertical', 'pane'):
-            metadata['layout'] = 'horizontal'
-        if 'folder' not in comic:
-            metadata['folder'] = to_folder_name(name)
+        metadata = comic_metadata(name, comic)
         parser = ComicParser.load_parser(comic, comic_presets, comic_mixins)
-        comic_parsers.add(ComicDownloader(parser, metadata).load_comics())
+        comic_parsers.add(crawl_series(ComicDownloader(parser, metadata, update_only=update_only), series_limit))
     await comic_parsers
 
 
@@ -93,17 +103,21 @@ async def load_guess_for(name, url, comic_presets, comic_mixins):
     return name, data, comics
 
 
-async def async_main():
+async def async_main(update_only=False, series_limit=None):
     pending_tasks = FutureList()
     with open(FILE) as f:
-        comics_data = safe_load(f)
+        comics_data = load_yaml(f)
     comic_presets = comics_data.get('presets', {})
     comic_mixins = comics_data.get('mixins', {})
     comics = comics_data['comics']
-    pending_tasks.add(load_comics(comics, comic_presets, comic_mixins))
+    pending_tasks.add(load_comics(comics, comic_presets, comic_mixins, update_only=update_only, series_limit=series_limit))
     pending_tasks.add(load_guesses(FILE, comics_data))
     # for name, url in
-    await pending_tasks
+    try:
+        await pending_tasks
+    finally:
+        await image_fetcher.close()
+        log_state_load_times()
 
 
 def cancel_all_tasks():
@@ -127,10 +141,27 @@ def list_all_tasks():
         print()
 
 
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description='Download web comics to read offline.')
+    parser.add_argument('--update-only', action='store_true',
+                        help='Only check the tail of each series for new comics; skipping verification of existing comics and images.')
+    parser.add_argument('--series-limit', metavar='N', type=int,
+                        help='Number of series crawled at once; bounding memory on very large libraries. Default: no limit')
+    parser.add_argument('--profile', metavar='REPORT',
+                        help='Record event loop lag, slow callbacks and phase timings; writing a report to REPORT on exit.')
+    parser.add_argument('--profile-cprofile', action='store_true',
+                        help='Also run cProfile for each phase (parse, save, render). Requires --profile.')
+    parser.add_argument('--slow-callback', metavar='SECONDS', type=float, default=0.1,
+                        help='Callbacks taking longer than this are reported as slow. Default: %(default)s')
+    return parser.parse_args(args)
+
+
 def main():
+    args = parse_args()
     loop = asyncio.get_event_loop()
-    # loop.set_debug(True)
-    main = asyncio.ensure_future(async_main())
+    if args.profile:
+        profiler.start(loop, slow_callback_duration=args.slow_callback, use_cprofile=args.profile_cprofile)
+    main = asyncio.ensure_future(async_main(update_only=args.update_only, series_limit=args.series_limit))
     loop.add_signal_handler(signal.SIGHUP, list_all_tasks)
     loop.add_signal_handler(signal.SIGINT, main.cancel)
 
@@ -140,6 +171,9 @@ def main():
         log.exception('Main failed')
         pass
     print("MAIN COMPLETE")
+    if args.profile:
+        ## Stop the lag monitor so it doesn't hold up the pending loop below.
+        profiler.stop()
 
     def check_task(task):
         return task.done() and not task.cancelled() and not task.exception()
@@ -159,5 +193,7 @@ def main():
         tasks = asyncio.Task.all_tasks(asyncio.get_event_loop()) - retrieved_tasks
         log.info("Pending Loop. Has %d new items", len([task for task in tasks if not check_task(task)]))
 
+    if args.profile:
+        profiler.write_report(args.profile)
 
     loop.close()
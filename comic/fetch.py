@@ -0,0 +1,191 @@
+import asyncio
+from collections import defaultdict
+import logging
+import sys
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+
+try:
+    import h2  # noqa: F401 -- httpx needs it for HTTP/2.
+    import httpx
+except ImportError:
+    httpx = None
+
+
+log = logging.getLogger(__name__)
+
+## Statuses worth another attempt; anything else in the 4xx range won't change by asking again.
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+
+class AiohttpHostClient():
+
+    def __init__(self, host, connections):
+        self.host = host
+        ## One connector per host keeps a small pool of keep-alive connections to the CDN.
+        connector = aiohttp.TCPConnector(limit=connections)
+        self.session = aiohttp.ClientSession(connector=connector, skip_auto_headers=['User-Agent'])
+
+    async def fetch(self, url):
+        async with self.session.get(url) as response:
+            response.raise_for_status()
+            return response.headers, await response.read()
+
+    def retryable(self, error):
+        if isinstance(error, aiohttp.ClientResponseError):
+            return error.status in RETRY_STATUSES
+        return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError))
+
+    async def close(self):
+        await self.session.close()
+
+
+class Http2HostClient():
+
+    def __init__(self, host, connections):
+        self.host = host
+        limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+        ## Match aiohttp; which follows redirects and is told to skip the User-Agent header.
+        self.client = httpx.AsyncClient(http2=True, limits=limits, follow_redirects=True)
+        del self.client.headers['User-Agent']
+
+    async def fetch(self, url):
+        response = await self.client.get(url)
+        response.raise_for_status()
+        return response.headers, response.content
+
+    def retryable(self, error):
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code in RETRY_STATUSES
+        return isinstance(error, httpx.TransportError)
+
+    async def close(self):
+        await self.client.aclose()
+
+
+def default_client_factory(host, connections):
+    if httpx is not None:
+        return Http2HostClient(host, connections)
+    return AiohttpHostClient(host, connections)
+
+
+class BulkImageFetcher():
+
+    def __init__(self, connections_per_host=4, client_factory=default_client_factory, max_retries=3, backoff=0.5, concurrency=None):
+        self.connections_per_host = connections_per_host
+        self.client_factory = client_factory
+        self.max_retries = max_retries
+        ## Seconds before the first retry; doubling for each one after.
+        self.backoff = backoff
+        ## An AdaptiveLimit deciding how many fetches each host gets at once; the connection pool alone when None.
+        self.concurrency = concurrency
+        self._clients = {}
+        self._stats = defaultdict(lambda: {'requests': 0, 'bytes': 0, 'seconds': 0.0})
+
+    def client_for(self, url):
+        host = urlsplit(url).netloc
+        if host not in self._clients:
+            log.info("Opening %d connections to %s", self.connections_per_host, host)
+            self._clients[host] = self.client_factory(host, self.connections_per_host)
+        return self._clients[host]
+
+    async def fetch_once(self, client, url):
+        if self.concurrency is None:
+            return await client.fetch(url)
+        error = None
+        async with self.concurrency.slot(url) as slot:
+            try:
+                headers, content = await client.fetch(url)
+            except Exception as e:
+                ## Only failures that say the host is struggling count against its limit; a 404 doesn't.
+                if client.retryable(e):
+                    slot.record_failure()
+                error = e
+            else:
+                slot.record_bytes(len(content))
+        if error is not None:
+            raise error
+        return headers, content
+
+    async def fetch(self, url):
+        client = self.client_for(url)
+        retry = 0
+        while True:
+            retry += 1
+            start = time.perf_counter()
+            try:
+                headers, content = await self.fetch_once(client, url)
+            except Exception as e:
+                if retry >= self.max_retries or not client.retryable(e):
+                    raise
+                delay = self.backoff * 2 ** (retry - 1)
+                log.warning("Attempt %d to fetch %s failed (%r); retrying in %.1fs", retry, url, e, delay)
+                await asyncio.sleep(delay)
+                continue
+            stats = self._stats[client.host]
+            stats['requests'] += 1
+            stats['bytes'] += len(content)
+            stats['seconds'] += time.perf_counter() - start
+            return headers, content
+
+    async def fetch_all(self, urls):
+        ## Results come back in the same order as urls; requests to each host share that host's connections.
+        by_host = defaultdict(list)
+        for url in urls:
+            by_host[urlsplit(url).netloc].append(url)
+        results = {}
+
+        async def fetch_host(host_urls):
+            for url, result in zip(host_urls, await asyncio.gather(*[self.fetch(url) for url in host_urls])):
+                results[url] = result
+
+        await asyncio.gather(*[fetch_host(host_urls) for host_urls in by_host.values()])
+        return [results[url] for url in urls]
+
+    def log_throughput(self):
+        for host, stats in sorted(self._stats.items()):
+            log.info("%s: %d images, %d bytes, %.1f KiB/s request throughput",
+                     host, stats['requests'], stats['bytes'], stats['bytes'] / 1024 / (stats['seconds'] or 1))
+
+    async def close(self):
+        self.log_throughput()
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.close()
+
+
+async def compare(urls):
+    ## Times the loader's previous path (one shared session under a 25 request semaphore) against the bulk fetcher.
+    load_limit = asyncio.Semaphore(25)
+
+    async def fetch_single(session, url):
+        async with load_limit:
+            async with session.get(url) as response:
+                return await response.read()
+
+    start = time.perf_counter()
+    async with aiohttp.ClientSession(skip_auto_headers=['User-Agent']) as session:
+        sizes = [len(content) for content in await asyncio.gather(*[fetch_single(session, url) for url in urls])]
+    single_seconds = time.perf_counter() - start
+
+    fetcher = BulkImageFetcher()
+    start = time.perf_counter()
+    try:
+        await fetcher.fetch_all(urls)
+    finally:
+        await fetcher.close()
+    bulk_seconds = time.perf_counter() - start
+    total = sum(sizes)
+    print("single requests: %.2fs (%.1f KiB/s)" % (single_seconds, total / 1024 / single_seconds))
+    print("bulk fetcher:    %.2fs (%.1f KiB/s)" % (bulk_seconds, total / 1024 / bulk_seconds))
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    asyncio.get_event_loop().run_until_complete(compare(sys.argv[1:]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+from collections import OrderedDict
+import os
+
+from jinja2 import FileSystemLoader, Environment
+
+from comic.objects import Comic, load_yaml, dump_yaml
+from comic.profiling import profiler
+from comic.utils import to_folder_name
+
+
+## What's on disk and how to read it; without the crawler's limits, sessions or logging setup.
+FILE = 'comics.yaml'
+## Used by both comic_server and packs. Images for a comic id rarely change once downloaded; so browsers keep them
+## for a day. Pages gain comics; so they're always revalidated against their ETag.
+IMAGE_CACHE_CONTROL = 'public, max-age=86400'
+PAGE_CACHE_CONTROL = 'no-cache'
+
+this_dir = os.path.abspath(os.path.dirname(__file__))
+library_folder = os.path.abspath(os.path.join(this_dir, '../'))
+loader = FileSystemLoader([os.path.join(this_dir, 'templates/'), os.path.abspath(os.path.join(this_dir, '../templates/'))])
+environment = Environment(loader=loader)
+
+
+def comic_metadata(name, comic):
+    metadata = comic.get('meta', {})
+    for meta_keys in ['name', 'layout', 'folder', 'initialurl']:
+        if meta_keys in comic and meta_keys not in metadata:
+            metadata[meta_keys] = comic[meta_keys]
+    metadata.setdefault('name', name)
+    if metadata.get('layout') not in ('horizontal', 'vertical', 'pane'):
+        metadata['layout'] = 'horizontal'
+    if 'folder' not in comic:
+        metadata['folder'] = to_folder_name(name)
+    return metadata
+
+
+def library_metadata(filename=FILE):
+    ## Metadata for every configured comic keyed by folder; which is how the library is laid out on disk.
+    with open(filename) as f:
+        comics_data = load_yaml(f)
+    library = {}
+    for name, comic in comics_data['comics'].items():
+        metadata = comic_metadata(name, comic)
+        library[metadata['folder']] = metadata
+    return library
+
+
+class ComicSite():
+
+    def __init__(self, comic_info, comics, images, validators=None):
+        self.comic_info = comic_info
+        self.comics = OrderedDict(sorted(comics.items()))
+        self.images = dict(images)
+        self.validators = dict(validators or {})
+        self.config_file = None
+        ## Whether there's anything the config file doesn't have yet; so an unchanged series isn't rewritten.
+        self.changed = True
+
+    def load_file(self, config_file):
+        with open(config_file) as f:
+            existing_data = load_yaml(f)
+        if existing_data and existing_data.get('comics'):
+            existing_comics = existing_data['comics']
+            for comic_id, comic in sorted(existing_comics.items()):
+                self.set_comic(comic_id, Comic(**comic))
+        if existing_data and existing_data.get('images'):
+            existing_images = existing_data['images']
+            for image_url, image_path in existing_images.items():
+                self.set_image(image_url, image_path)
+        if existing_data and existing_data.get('validators'):
+            self.validators.update(existing_data['validators'])
+        self.changed = False
+
+    def set_comic(self, comic_id, new_comic):
+        if self.comics.get(comic_id) != new_comic:
+            self.comics[comic_id] = new_comic
+            self.changed = True
+
+    def sort_comics(self):
+        self.comics = OrderedDict(sorted(self.comics.items()))
+
+    def set_image(self, image_url, image_path):
+        if self.images.get(image_url) != image_path:
+            self.images[image_url] = image_path
+            self.changed = True
+
+    def get_image(self, image_url):
+        return self.images.get(image_url)
+
+    def set_validators(self, url, headers):
+        validators = {}
+        if headers is not None:
+            if headers.get('ETag'):
+                validators['etag'] = headers['ETag']
+            if headers.get('Last-Modified'):
+                validators['last_modified'] = headers['Last-Modified']
+        if self.validators.get(url) == (validators or None):
+            return
+        if validators:
+            self.validators[url] = validators
+        else:
+            self.validators.pop(url)
+        self.changed = True
+
+    def get_conditional_headers(self, url):
+        validators = self.validators.get(url, {})
+        headers = {}
+        if 'etag' in validators:
+            headers['If-None-Match'] = validators['etag']
+        if 'last_modified' in validators:
+            headers['If-Modified-Since'] = validators['last_modified']
+        return headers
+
+    @property
+    def last_id(self):
+        return next(iter(reversed(self.comics.keys()))) if self.comics else 0
+
+    @property
+    def last_comic(self):
+        return next(iter(reversed(self.comics.values()))) if self.comics else None
+
+    @property
+    def last_entry(self):
+        return (self.last_id, self.last_comic)
+
+    async def save(self):
+        if self.config_file is None:
+            raise ValueError('Set the config_file attribute before trying to save.')
+        if not self.changed:
+            return
+        with profiler.phase('save'):
+            self.sort_comics()
+            with open(self.config_file, 'w') as f:
+                dump_yaml({'comics': self.comics, 'images': self.images, 'validators': self.validators}, f)
+        self.changed = False
+
+    def render_html(self):
+        template_path = self.comic_info.get('template', 'base.html')
+        with profiler.phase('render'):
+            template = environment.get_template(template_path)
+            return template.render(comic_info=self.comic_info, comics=self.comics, images=self.images)
+
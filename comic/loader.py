@@ -1,80 +1,39 @@
 import asyncio
-from collections import namedtuple, OrderedDict
 import logging
 import mimetypes
 import os
+import time
 
 import bs4
-from jinja2 import FileSystemLoader, Environment
-from yaml import add_representer, safe_load, safe_dump, SafeDumper
 
+from comic.concurrency import AdaptiveLimit
 from comic.utils import mkdir
 from comic.exception import SkipComicError
-from comic.objects import FutureList, Comic, Client2
+from comic.fetch import BulkImageFetcher
+from comic.library import ComicSite, library_folder
+from comic.objects import FutureList, Client2
+from comic.profiling import profiler
+from comic.streaming import stream_matches
 
 log = logging.getLogger(__name__)
 
-this_dir = os.path.abspath(os.path.dirname(__file__))
-loader = FileSystemLoader([os.path.join(this_dir, 'templates/'), os.path.abspath(os.path.join(this_dir, '../templates/'))])
-environment = Environment(loader=loader)
-
-load_limit = asyncio.Semaphore(25)
-
-
-class ComicSite():
-
-    def __init__(self, comic_info, comics, images):
-        self.comic_info = comic_info
-        self.comics = OrderedDict(sorted(comics.items()))
-        self.images = dict(images)
-        self.config_file = None
-
-    def set_comic(self, comic_id, new_comic):
-        self.comics[comic_id] = new_comic
-
-    def sort_comics(self):
-        self.comics = OrderedDict(sorted(self.comics.items()))
-
-    def set_image(self, image_url, image_path):
-        self.images[image_url] = image_path
-
-    def get_image(self, image_url):
-        return self.images.get(image_url)
-
-    @property
-    def last_id(self):
-        return next(iter(reversed(self.comics.keys()))) if self.comics else 0
-
-    @property
-    def last_comic(self):
-        return next(iter(reversed(self.comics.values()))) if self.comics else None
-
-    @property
-    def last_entry(self):
-        return (self.last_id, self.last_comic)
-
-    async def save(self):
-        if self.config_file is None:
-            raise ValueError('Set the config_file attribute before trying to save.')
-        self.sort_comics()
-        with open(self.config_file, 'w') as f:
-            safe_dump({'comics': self.comics, 'images': self.images}, f)
-
-    async def save_html(self, location):
-        template_path = self.comic_info.get('template', 'base.html')
-        template = environment.get_template(template_path)
-        with open(location, 'w') as f:
-            print(location)
-            f.write(template.render(comic_info=self.comic_info, comics=self.comics, images=self.images))
+## Pages and images are limited separately; small pages are latency bound whilst big images are bandwidth bound.
+## Each also has a total across all hosts; every series starts at once, so without it hundreds of hosts could each open a full pool.
+page_limit = AdaptiveLimit('page', initial=8, maximum=32, total=32)
+image_limit = AdaptiveLimit('image', initial=4, maximum=16, total=32)
+image_fetcher = BulkImageFetcher(connections_per_host=image_limit.maximum, concurrency=image_limit)
+## config_file -> seconds taken to load it.
+state_load_times = {}
 
 
 class ComicDownloader:
 
-    def __init__(self, parser, metadata):
+    def __init__(self, parser, metadata, update_only=False):
         self.parser = parser
+        self.update_only = update_only
         self.comic_site = ComicSite(metadata, {}, {})
         self.folder = metadata['folder']
-        self.base_folder = os.path.abspath(os.path.join(this_dir, '../', self.folder))
+        self.base_folder = os.path.join(library_folder, self.folder)
         mkdir(self.base_folder)
         self.images_folder = 'images/'
         mkdir(os.path.join(self.base_folder, self.images_folder))
@@ -82,32 +41,34 @@ class ComicDownloader:
         self.initialurl = metadata['initialurl']
         self.db = {}
 
+    def load_state_file(self):
+        start = time.perf_counter()
+        self.comic_site.load_file(self.config_file)
+        state_load_times[self.config_file] = time.perf_counter() - start
+        log.info('Loaded %s in %.3fs', self.config_file, state_load_times[self.config_file])
+
     async def load_existing_comics(self):
         try:
-            with open(self.config_file) as f:
-                existing_data = safe_load(f)
-                if existing_data and existing_data.get('comics'):
-                    existing_comics = existing_data['comics']
-                    for comic_id, comic in sorted(existing_comics.items()):
-                        self.comic_site.set_comic(comic_id, Comic(**comic))
-                if existing_data and existing_data.get('images'):
-                    existing_images = existing_data['images']
-                    for image_url, image_path in existing_images.items():
-                        self.comic_site.set_image(image_url, image_path)
+            ## Parse in a worker thread so one big library doesn't stall every other series' crawl.
+            await asyncio.get_event_loop().run_in_executor(None, self.load_state_file)
+        except FileNotFoundError:
+            log.info('No existing comics in %s.', self.config_file)
         except:
             log.exception('Exception occoured whilst loading file %s. Ignoring file.', self.config_file)
         self.comic_site.config_file = self.config_file
         return self.comic_site
 
-    async def get_current_comic(self, client):
+    async def get_current_comic(self, client, conditional=False):
         last_id, last_comic = self.comic_site.last_entry
         if last_comic:
             current_id = last_id + 1
             if not last_comic.next:
-                last_comic = await self.load_comic(client, last_comic.origin)
+                reloaded_comic = await self.load_comic(client, last_comic.origin, conditional=conditional)
+                if reloaded_comic is not None:
+                    last_comic = reloaded_comic
                 if last_comic.next:
                     self.comic_site.set_comic(last_id, last_comic)
-                    self.comic_site.save()
+                    await self.comic_site.save()
             current_url = last_comic.next
         else:
             current_url = self.initialurl
@@ -117,13 +78,13 @@ class ComicDownloader:
     async def load_comics(self):
         pending_futures = FutureList()
         await self.load_existing_comics()
-        await self.comic_site.save_html(os.path.join(self.base_folder, 'index.html'))
         last_id_in_file = None
         try:
             with Client2(self.comic_site.comic_info['name'], skip_auto_headers=['User-Agent']) as client:
-                if self.comic_site and last_id_in_file is None:
+                if self.comic_site and last_id_in_file is None and not self.update_only:
                     pending_futures.add(self.check_existing_comics(client))
-                current_id, current_url = await self.get_current_comic(client)
+                ## In update only mode the tail page is fetched conditionally; so an unchanged series costs a single 304.
+                current_id, current_url = await self.get_current_comic(client, conditional=self.update_only)
                 if last_id_in_file is None:
                     last_id_in_file = current_id
                 while current_url is not None:
@@ -149,7 +110,6 @@ class ComicDownloader:
             raise
         else:
             await self.comic_site.save()
-            await self.comic_site.save_html(os.path.join(self.base_folder, 'index.html'))
 
     async def check_existing_comics(self, client):
         image_downloads = FutureList()
@@ -166,17 +126,35 @@ class ComicDownloader:
                 await image_downloads
             finally:
                 await self.comic_site.save()
-            await self.comic_site.save_html(os.path.join(self.base_folder, 'index.html'))
 
-    async def load_comic(self, client, url):
-        async with load_limit:
-            async with await client.get(url) as response:
-                content = await response.text()
+    async def load_comic(self, client, url, conditional=False):
+        ## A conditional load returns None when the page hasn't changed since it was last seen.
+        headers = self.comic_site.get_conditional_headers(url) if conditional else {}
+        async with page_limit.slot(url) as slot:
+            async with await client.get(url, headers=headers) as response:
+                if response.status == 304:
+                    log.info("Comic at %s is unchanged.", url)
+                    return None
+                if response.status == 429 or response.status >= 500:
+                    slot.record_failure()
+                response_headers = response.headers
+                if self.parser.streaming:
+                    content = await stream_matches(response, self.parser, slot)
+                else:
+                    content = await response.text()
+                    slot.record_bytes(len(content))
         try:
-            return self.parser.load_comic(url, content)
+            with profiler.phase('parse'):
+                if self.parser.streaming:
+                    comic = self.parser.load_matches(url, content)
+                else:
+                    comic = self.parser.load_comic(url, content)
         except:
             log.exception("load_comic failed. Called with url=%s", url)
             raise
+        ## Only the tail of the series gets re-checked; so only keep validators for pages without a next link.
+        self.comic_site.set_validators(url, response_headers if comic.next is None else None)
+        return comic
 
     async def comic_info(self, client, comic, comic_id):
         image_url = comic.image_url
@@ -235,13 +213,12 @@ class ComicDownloader:
             image_path_ext = image_path + image_extn
             image_full_path_ext = image_full_path + image_extn
 
-            async with load_limit:
-                print("Downloading %s into %s" % (image_url, image_path_ext))
-                async with client.get(image_url) as r:
-                    with open(image_full_path_ext, 'wb') as f:
-                        f.write(await r.read())
-                    print("Downloaded  %s into %s" % (image_url, image_path_ext))
-            self.comic_site.set_image(image_url, image_path)
+            print("Downloading %s into %s" % (image_url, image_path_ext))
+            _, content = await image_fetcher.fetch(image_url)
+            with open(image_full_path_ext, 'wb') as f:
+                f.write(content)
+            print("Downloaded  %s into %s" % (image_url, image_path_ext))
+            self.comic_site.set_image(image_url, image_path_ext)
             await self.comic_site.save()
         except:
             log.exception("download_comic failed for cid=%s; comic=%r", comic_id, comic )
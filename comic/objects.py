@@ -3,16 +3,32 @@ from collections import namedtuple, OrderedDict
 import logging
 
 import aiohttp
+import yaml
 from yaml import add_representer, SafeDumper
 
+try:
+    ## LibYAML is several times faster than the pure python loader and dumper.
+    from yaml import CSafeLoader as FastSafeLoader, CSafeDumper as FastSafeDumper
+except ImportError:
+    from yaml import SafeLoader as FastSafeLoader, SafeDumper as FastSafeDumper
+
 
 log = logging.getLogger(__name__)
 
 
 
 Comic = namedtuple('Comic', 'origin, image_url, description, title, next, prev')
-add_representer(Comic, lambda dumper, comic: dumper.represent_dict(comic._asdict()), Dumper=SafeDumper)
-add_representer(OrderedDict, lambda dumper, odict: dumper.represent_dict(odict), Dumper=SafeDumper)
+for dumper_class in {SafeDumper, FastSafeDumper}:
+    add_representer(Comic, lambda dumper, comic: dumper.represent_dict(comic._asdict()), Dumper=dumper_class)
+    add_representer(OrderedDict, lambda dumper, odict: dumper.represent_dict(odict), Dumper=dumper_class)
+
+
+def load_yaml(stream):
+    return yaml.load(stream, Loader=FastSafeLoader)
+
+
+def dump_yaml(data, stream):
+    return yaml.dump(data, stream, Dumper=FastSafeDumper)
 
 
 class Client2(aiohttp.ClientSession):
@@ -34,14 +50,13 @@ class Client2(aiohttp.ClientSession):
         # log.info("Deleting session %s", self.__name, stack_info=True)
         super().__del__(self)
 
-    @asyncio.coroutine
-    def _request(self, *a, **k):
+    async def _request(self, *a, **k):
         e = None
         retry = 0
         while retry < self.__max_retries:
             retry += 1
             try:
-                return (yield from super()._request(*a, **k))
+                return await super()._request(*a, **k)
             except aiohttp.ClientResponseError as e:
                 log.exception("Retry %d failed to %s %s", retry, *a[0:2])
                 ## Damn thing closed the connector.
@@ -2,6 +2,7 @@ import logging
 import re
 
 import bs4
+import soupsieve
 
 from comic.utils import dict_merge, resolve_url
 from comic.objects import Comic
@@ -9,6 +10,8 @@ from comic.exception import MissingElementError, SkipComicError
 
 log = logging.getLogger(__name__)
 
+UNSAFE_ELEMENTS = soupsieve.compile('iframe, script, link, .twitterbutton, .clear, .ssba, .attachment-full')
+
 
 def html_to_text(tag, include_line_breaks=False):
     return re.sub(r'\s\s+', ' ', tag.get_text())
@@ -17,9 +20,13 @@ def html_to_text(tag, include_line_breaks=False):
 def html_to_safer_html(tag):
     if not any(tag.stripped_strings):
         return ""
-    for unsafe_selector in ['iframe', 'script', 'link', '.twitterbutton', '.clear', '.ssba', '.attachment-full']:
-        for unsave_tag in tag.select(unsafe_selector):
-            unsave_tag.decompose()
+    ## Collect first; decomposing whilst walking the descendants would break the walk.
+    unsafe_tags = [child for child in tag.descendants if isinstance(child, bs4.Tag) and UNSAFE_ELEMENTS.match(child)]
+    unsafe_ids = set(map(id, unsafe_tags))
+    for unsafe_tag in unsafe_tags:
+        ## Nested unsafe tags go with their outermost unsafe parent.
+        if not any(id(parent) in unsafe_ids for parent in unsafe_tag.parents):
+            unsafe_tag.decompose()
     for s_ in tag.parents:
         ## last is None, 2nd last is the BeautifulSoup Object.
         if s_ is not None:
@@ -82,6 +89,7 @@ class ComicParser():
 
     def __init__(self, comic_info):
         includealt = comic_info.get('includealt', True)
+        self.streaming = comic_info.get('streaming', False)
         self.parsers = [
             ElementTextParser(comic_info['title'], 'title', ignore_missing=False),
             ComicImageParser(comic_info['image'], includealt=includealt),
@@ -92,19 +100,39 @@ class ComicParser():
             if comic_info['description'].lower() != '!!empty!!':
                 self.parsers.append(ElementTextParser(comic_info['description'], 'description', raw_html=True))
 
+    def match_elements(self, soup):
+        ## A single walk of the tree finds the first match for every parser's selector; stopping once all have matched.
+        matches = {}
+        pending = list(self.parsers)
+        for tag in soup.descendants:
+            if not isinstance(tag, bs4.Tag):
+                continue
+            matched = [parser for parser in pending if parser.matcher.match(tag)]
+            if matched:
+                for parser in matched:
+                    matches[parser] = tag
+                pending = [parser for parser in pending if parser not in matches]
+                if not pending:
+                    break
+        return matches
+
     def load_comic(self, url, content):
-        soup = bs4.BeautifulSoup(content, 'html.parser')
-        comic = Comic(url, None, None, None, None, None)
+        return self.load_matches(url, self.match_elements(bs4.BeautifulSoup(content, 'html.parser')))
+
+    def load_matches(self, url, matches):
+        fields = dict.fromkeys(Comic._fields)
+        fields['origin'] = url
         skip_comic = False
         for parser in self.parsers:
             try:
-                comic = parser.update_comic(url, soup, comic)
+                parser.extract(url, matches.get(parser), fields)
             except MissingElementError as e:
                 print('Failed to load required element from %s' % (url))
                 print('Using %s parser.' % (parser))
                 raise
             except SkipComicError:
                 skip_comic = True
+        comic = Comic(**fields)
         if skip_comic:
             raise SkipComicError(comic)
         return comic
@@ -112,8 +140,16 @@ class ComicParser():
 
 class ElementParser():
 
-    def update_comic(self, url, soup, comic):
-        return comic
+    ## Whether the comic can't be loaded without this element.
+    required = False
+
+    def __init__(self, selector):
+        self.selector = selector
+        self.matcher = soupsieve.compile(selector)
+
+    def extract(self, url, tag, fields):
+        ## tag is the first element matching the selector; or None if nothing did.
+        pass
 
     def __repr__(self):
         return "%s(**%r)" % (self.__class__.__qualname__, self.__dict__)
@@ -122,70 +158,67 @@ class ElementParser():
 class ElementTextParser(ElementParser):
 
     def __init__(self, selector, dest, ignore_missing=True, raw_html=False):
-        self.selector, _, self.attribute = selector.partition('!')
+        selector, _, self.attribute = selector.partition('!')
+        super().__init__(selector)
         self.dest = dest
         self.ignore_missing = ignore_missing
         self.raw_html = raw_html
+        self.required = not ignore_missing
 
-    def update_comic(self, url, soup, comic):
-        tags = soup.select(self.selector)
-        if not tags:
+    def extract(self, url, tag, fields):
+        if tag is None:
             if self.ignore_missing:
-                return comic._replace(**{self.dest: ''})
+                fields[self.dest] = ''
+                return
             else:
-                raise MissingElementError(self, soup)
-        tag = tags[0]
+                raise MissingElementError(self, url)
         if self.attribute:
-            if self.attribute in tag.attrs or self.ignore_missing:
-                content = tag.get(self.attribute, '')
-            elif self.attribute not in tag and not self.ignore_missing:
+            if self.attribute not in tag.attrs and not self.ignore_missing:
                 print(self.attribute, tag)
-                raise MissingElementError(self, soup)
-        if self.raw_html:
-            content = html_to_safer_html(tags[0])
+                raise MissingElementError(self, url)
+            content = tag.get(self.attribute, '')
+        elif self.raw_html:
+            content = html_to_safer_html(tag)
         else:
-            content = html_to_text(tags[0])
-        return comic._replace(**{self.dest: content})
+            content = html_to_text(tag)
+        fields[self.dest] = content
 
 
 class ComicImageParser(ElementParser):
 
     def __init__(self, selector, *, includealt=True):
-        self.selector = selector
+        super().__init__(selector)
         self.includealt = includealt
+        self.required = True
 
-    def update_comic(self, url, soup, comic):
-        image = soup.select(self.selector)
-        if not image:
-            raise SkipComicError(comic, self, soup)
-        image = image[0]
-        img_src = resolve_url(url, image['src'])
-        replacement = {'image_url': img_src}
+    def extract(self, url, image, fields):
+        if image is None:
+            raise SkipComicError(None, self, url)
+        fields['image_url'] = resolve_url(url, image['src'])
         if self.includealt:
-            replacement['description'] = image.get('title', image.get('alt', None))
-        return comic._replace(**replacement)
+            fields['description'] = image.get('title', image.get('alt', None))
 
 
 class LinkParser(ElementParser):
 
     def __init__(self, selector, dest, allow_missing=False):
-        self.selector = selector
+        super().__init__(selector)
         self.dest = dest
         self.allow_missing = allow_missing
+        self.required = not allow_missing
 
-    def update_comic(self, url, soup, comic):
-        tags = soup.select(self.selector)
-        if not tags:
+    def extract(self, url, tag, fields):
+        if tag is None:
             if not self.allow_missing:
-                raise MissingElementError(self, soup)
+                raise MissingElementError(self, url)
             else:
-                return comic
-        href = tags[0].get('href', '#')
+                return
+        href = tag.get('href', '#')
         if href.startswith('javascript'):
             ## We can't handle javascript links.
-            return comic
+            return
         link_url = resolve_url(url, href)
         if url == link_url:
             ## The link leads nowhere.
-            return comic
-        return comic._replace(**{self.dest: link_url})
+            return
+        fields[self.dest] = link_url
@@ -0,0 +1,134 @@
+import asyncio
+from collections import defaultdict, OrderedDict
+from contextlib import contextmanager
+import cProfile
+import io
+import logging
+import pstats
+import re
+import time
+
+
+log = logging.getLogger(__name__)
+
+CORO_NAME_RE = re.compile(r'coro=<([\w.<>]+)\(')
+
+
+## Collects the 'Executing ... took ... seconds' warnings asyncio emits in debug mode.
+class SlowCallbackHandler(logging.Handler):
+
+    def __init__(self, profiler):
+        super().__init__(logging.WARNING)
+        self.profiler = profiler
+
+    def emit(self, record):
+        if not record.msg.startswith('Executing') or len(record.args or ()) != 2:
+            return
+        handle, duration = record.args
+        match = CORO_NAME_RE.search(str(handle))
+        ## The handle names the task's outermost coroutine; so add the phases that ran during the slow step.
+        name = match.group(1) if match else str(handle)
+        phases = self.profiler.phases_since(time.perf_counter() - duration)
+        if phases:
+            name = '%s [%s]' % (name, ', '.join(phases))
+        self.profiler.record_slow_callback(name, duration)
+
+
+class Profiler():
+
+    def __init__(self):
+        self.enabled = False
+        self.use_cprofile = False
+        self.lag_interval = 0.1
+        self.lag_samples = []
+        self.slow_callbacks = defaultdict(list)
+        self.phase_times = defaultdict(list)
+        self.phase_profiles = {}
+        self._monitor = None
+        self._handler = None
+        self._active_phase = None
+        ## phase name -> when it last finished.
+        self._phase_ends = {}
+
+    def start(self, loop, *, slow_callback_duration=0.1, use_cprofile=False):
+        self.enabled = True
+        self.use_cprofile = use_cprofile
+        loop.set_debug(True)
+        loop.slow_callback_duration = slow_callback_duration
+        self._handler = SlowCallbackHandler(self)
+        logging.getLogger('asyncio').addHandler(self._handler)
+        self._monitor = asyncio.ensure_future(self.monitor_lag(loop), loop=loop)
+
+    def stop(self):
+        if self._monitor is not None:
+            self._monitor.cancel()
+            self._monitor = None
+        if self._handler is not None:
+            logging.getLogger('asyncio').removeHandler(self._handler)
+            self._handler = None
+
+    async def monitor_lag(self, loop):
+        while True:
+            expected = loop.time() + self.lag_interval
+            await asyncio.sleep(self.lag_interval)
+            self.lag_samples.append(max(0.0, loop.time() - expected))
+
+    def phases_since(self, since):
+        ## The warning is logged as soon as the slow step returns; so phases that finished since it started ran inside it.
+        return sorted(name for name, end in self._phase_ends.items() if end >= since)
+
+    def record_slow_callback(self, name, duration):
+        self.slow_callbacks[name].append(duration)
+
+    @contextmanager
+    def phase(self, name):
+        ## Phases don't nest; time spent in an inner phase is counted against the outer one.
+        if not self.enabled or self._active_phase is not None:
+            yield
+            return
+        self._active_phase = name
+        profile = None
+        if self.use_cprofile:
+            profile = self.phase_profiles.setdefault(name, cProfile.Profile())
+            profile.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.phase_times[name].append(end - start)
+            self._phase_ends[name] = end
+            if profile is not None:
+                profile.disable()
+            self._active_phase = None
+
+    def report(self):
+        out = io.StringIO()
+        out.write('== Event loop lag ==\n')
+        if self.lag_samples:
+            samples = sorted(self.lag_samples)
+            out.write('samples: %d  mean: %.4fs  p95: %.4fs  max: %.4fs\n' % (
+                len(samples), sum(samples) / len(samples), samples[int(len(samples) * 0.95)], samples[-1]))
+        else:
+            out.write('no samples\n')
+        out.write('\n== Slow callbacks ==\n')
+        slow = OrderedDict(sorted(self.slow_callbacks.items(), key=lambda item: -sum(item[1])))
+        for name, durations in slow.items():
+            out.write('%-60s count: %5d  total: %8.3fs  max: %.3fs\n' % (name, len(durations), sum(durations), max(durations)))
+        if not slow:
+            out.write('none\n')
+        out.write('\n== Phases ==\n')
+        for name, durations in sorted(self.phase_times.items()):
+            out.write('%-10s count: %5d  total: %8.3fs  max: %.4fs\n' % (name, len(durations), sum(durations), max(durations)))
+        for name, profile in sorted(self.phase_profiles.items()):
+            out.write('\n== cProfile: %s ==\n' % (name, ))
+            pstats.Stats(profile, stream=out).sort_stats('cumulative').print_stats(25)
+        return out.getvalue()
+
+    def write_report(self, filename):
+        with open(filename, 'w') as f:
+            f.write(self.report())
+        log.info('Wrote profile report to %s', filename)
+
+
+profiler = Profiler()
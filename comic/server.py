@@ -0,0 +1,90 @@
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+
+from aiohttp import web
+
+from comic.library import FILE, IMAGE_CACHE_CONTROL, PAGE_CACHE_CONTROL, ComicSite, library_folder, library_metadata
+
+
+log = logging.getLogger(__name__)
+
+
+class LibraryServer():
+
+    def __init__(self, config_file=FILE, folder=library_folder):
+        self.config_file = config_file
+        self.folder = folder
+        self.library = library_metadata(config_file)
+        ## folder -> (.data.yaml mtime, etag, rendered html)
+        self._pages = {}
+
+    def render_page(self, series):
+        data_file = os.path.join(self.folder, series, '.data.yaml')
+        try:
+            mtime = os.stat(data_file).st_mtime
+        except FileNotFoundError:
+            raise web.HTTPNotFound()
+        cached = self._pages.get(series)
+        if cached and cached[0] == mtime:
+            return cached[1], cached[2]
+        comic_site = ComicSite(self.library[series], {}, {})
+        comic_site.load_file(data_file)
+        html = comic_site.render_html()
+        etag = '"%s"' % (hashlib.sha1(html.encode('utf-8')).hexdigest(), )
+        self._pages[series] = (mtime, etag, html)
+        return etag, html
+
+    async def handle_index(self, request):
+        links = ''.join("<li><a href='%s/'>%s</a></li>" % (folder, metadata['name'])
+                        for folder, metadata in sorted(self.library.items()))
+        return web.Response(text='<html><body><ul>%s</ul></body></html>' % (links, ), content_type='text/html')
+
+    async def handle_series_redirect(self, request):
+        ## Relative image links in the page only resolve under /series/.
+        series = request.match_info['series']
+        if series not in self.library:
+            raise web.HTTPNotFound()
+        raise web.HTTPMovedPermanently('/%s/' % (series, ))
+
+    async def handle_series(self, request):
+        series = request.match_info['series']
+        if series not in self.library:
+            raise web.HTTPNotFound()
+        ## Loading the YAML and rendering the template can take a while for a long series; keep it off the event loop.
+        etag, html = await asyncio.get_event_loop().run_in_executor(None, self.render_page, series)
+        headers = {'ETag': etag, 'Cache-Control': PAGE_CACHE_CONTROL}
+        if request.headers.get('If-None-Match') == etag:
+            return web.Response(status=304, headers=headers)
+        return web.Response(text=html, content_type='text/html', headers=headers)
+
+    async def handle_image(self, request):
+        series = request.match_info['series']
+        if series not in self.library:
+            raise web.HTTPNotFound()
+        images_folder = os.path.realpath(os.path.join(self.folder, series, 'images'))
+        image_path = os.path.realpath(os.path.join(images_folder, request.match_info['image']))
+        if os.path.dirname(image_path) != images_folder or not os.path.isfile(image_path):
+            raise web.HTTPNotFound()
+        ## FileResponse uses sendfile and answers If-Modified-Since itself.
+        return web.FileResponse(image_path, headers={'Cache-Control': IMAGE_CACHE_CONTROL})
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_route('GET', '/', self.handle_index)
+        app.router.add_route('GET', '/{series}', self.handle_series_redirect)
+        app.router.add_route('GET', '/{series}/', self.handle_series)
+        app.router.add_route('GET', '/{series}/index.html', self.handle_series)
+        app.router.add_route('GET', '/{series}/images/{image}', self.handle_image)
+        return app
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Browse the downloaded comics; rendering each series when it is requested.')
+    parser.add_argument('--config', default=FILE, help='Comics configuration file. Default: %(default)s')
+    parser.add_argument('--port', type=int, default=8080)
+    args = parser.parse_args()
+    web.run_app(LibraryServer(args.config).make_app(), port=args.port)
@@ -0,0 +1,213 @@
+import argparse
+import codecs
+import logging
+import sys
+import time
+
+import bs4
+from bs4.builder._htmlparser import BeautifulSoupHTMLParser
+
+from comic.objects import load_yaml
+from comic.parsers import ComicParser
+from comic.profiling import profiler
+
+
+log = logging.getLogger(__name__)
+
+CHUNK_SIZE = 16 * 1024
+
+
+class ClosingSoup(bs4.BeautifulSoup):
+
+    ## Set to a StreamingSoup that's told about each element as it is closed.
+    on_close = None
+
+    def popTag(self):
+        ## popTag returns the new current tag; not the one that was closed.
+        closed = self.tagStack[-1] if self.tagStack else None
+        current = super().popTag()
+        if closed is not None and self.on_close is not None:
+            self.on_close(closed)
+        return current
+
+
+class StreamingSoup():
+
+    def __init__(self, comic_parser):
+        self.comic_parser = comic_parser
+        self.matches = {}
+        ## Parsers whose match can't be replaced any more; closed elements aren't checked against them.
+        self.final = set()
+        self.done = False
+        ## An empty document leaves the soup ready to have more markup pushed into it.
+        self.soup = ClosingSoup('', 'html.parser')
+        args, kwargs = self.soup.builder.parser_args
+        try:
+            self.parser = BeautifulSoupHTMLParser(*args, **kwargs)
+            self.parser.soup = self.soup
+        except TypeError:
+            ## Newer versions of bs4 take the soup as the first argument.
+            self.parser = BeautifulSoupHTMLParser(self.soup, *args, **kwargs)
+        self.soup.on_close = self.tag_closed
+
+    def feed(self, text):
+        self.parser.feed(text)
+
+    def tag_closed(self, tag):
+        ## Each element is only matched once; when it closes and all of its content is known.
+        ## Elements close children first; so a later match only replaces an earlier one when it's an ancestor,
+        ## which keeps the first match in document order just like soup.select().
+        if self.done:
+            return
+        matched = False
+        for parser in self.comic_parser.parsers:
+            if parser in self.final or not parser.matcher.match(tag):
+                continue
+            previous = self.matches.get(parser)
+            if previous is None or any(parent is tag for parent in previous.parents):
+                self.matches[parser] = tag
+                matched = True
+        if matched:
+            self.check_matches()
+
+    def settled(self, parser):
+        ## An open ancestor that also matches would replace the current match when it closes.
+        if parser in self.final:
+            return True
+        if parser in self.matches and not any(parser.matcher.match(tag) for tag in self.soup.tagStack[1:]):
+            self.final.add(parser)
+            return True
+        return False
+
+    def check_matches(self):
+        ## Only stop once every parser has settled; even optional ones. Anything that hasn't might still be further
+        ## down the page, and a next link found late is what keeps the crawl going. Pages missing an element are read to the end.
+        if all(self.settled(parser) for parser in self.comic_parser.parsers):
+            self.done = True
+
+    def close(self):
+        self.parser.close()
+        self.soup.endData()
+        while self.soup.currentTag.name != self.soup.ROOT_TAG_NAME:
+            self.soup.popTag()
+        self.done = True
+        return self.matches
+
+
+async def stream_matches(response, comic_parser, slot=None, chunk_size=CHUNK_SIZE):
+    ## Parses the response as it arrives; dropping the rest of the download once the comic's elements are found.
+    ## The bytes actually read are recorded against the slot; so the page limit can judge the cost per KiB.
+    decoder = codecs.getincrementaldecoder(response.charset or 'utf-8')(errors='replace')
+    streaming_soup = StreamingSoup(comic_parser)
+    bytes_read = 0
+    while True:
+        chunk = await response.content.read(chunk_size)
+        with profiler.phase('parse'):
+            streaming_soup.feed(decoder.decode(chunk, final=not chunk))
+            if not chunk:
+                break
+            bytes_read += len(chunk)
+            if streaming_soup.done:
+                log.debug("Found the comic in the first %d bytes of %s", bytes_read, response.url)
+                response.close()
+                break
+    if slot is not None:
+        slot.record_bytes(bytes_read)
+    with profiler.phase('parse'):
+        return streaming_soup.close()
+
+
+## Page layouts the streaming parser must read the same as a plain parse; using the wordpress preset's selectors.
+CHECK_COMIC_INFO = {
+    'includealt': False,
+    'links': {'prev': '.navi-prev', 'next': '.navi-next'},
+    'image': '#comic img',
+    'title': 'h2.post-title',
+    'description': '.entry',
+}
+CHECK_FILLER = '<p>filler</p>' * 4000
+CHECK_LAYOUTS = {
+    'one block': '<div class="post"><div id="comic"><img src="/1.png"></div><h2 class="post-title">One</h2>'
+                 '<div class="entry">desc</div><a class="navi-prev" href="/p/0">prev</a>'
+                 '<a class="navi-next" href="/p/2">next</a></div>' + CHECK_FILLER,
+    'next after the block': '<div class="post"><div id="comic"><img src="/1.png"></div><h2 class="post-title">One</h2>'
+                            '<div class="entry">desc</div><a class="navi-prev" href="/p/0">prev</a></div>'
+                            + CHECK_FILLER + '<a class="navi-next" href="/p/2">next</a>',
+    'description after the block': '<div class="post"><div id="comic"><img src="/1.png"></div><h2 class="post-title">One</h2>'
+                                   '<a class="navi-prev" href="/p/0">prev</a><a class="navi-next" href="/p/2">next</a></div>'
+                                   + CHECK_FILLER + '<div class="entry">desc-late</div>',
+    'matching ancestor': '<div class="entry"><div id="comic"><img src="/1.png"></div><h2 class="post-title">One</h2>'
+                         '<div class="entry">inner</div><a class="navi-next" href="/p/2">next</a>' + CHECK_FILLER + '</div>',
+    'last page': '<div class="post"><div id="comic"><img src="/1.png"></div><h2 class="post-title">One</h2>'
+                 '<div class="entry">desc</div><a class="navi-prev" href="/p/0">prev</a></div>' + CHECK_FILLER,
+}
+
+
+def stream_content(content, comic_parser, chunk_size=CHUNK_SIZE):
+    ## Feeds already downloaded bytes through a StreamingSoup like stream_matches does; returning the matches and bytes read.
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    streaming_soup = StreamingSoup(comic_parser)
+    bytes_read = 0
+    while bytes_read < len(content) and not streaming_soup.done:
+        chunk = content[bytes_read:bytes_read + chunk_size]
+        bytes_read += len(chunk)
+        streaming_soup.feed(decoder.decode(chunk, final=bytes_read >= len(content)))
+    return streaming_soup.close(), bytes_read
+
+
+def compare(filename, comic_info, all_bases, all_mixins, chunk_size=CHUNK_SIZE):
+    ## Times a plain parse of a saved page against streaming it in chunks.
+    with open(filename, 'rb') as f:
+        content = f.read()
+    comic_parser = ComicParser.load_parser(comic_info, all_bases, all_mixins)
+
+    start = time.perf_counter()
+    comic = comic_parser.load_comic(filename, content.decode('utf-8', 'replace'))
+    plain_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    matches, bytes_read = stream_content(content, comic_parser, chunk_size)
+    streamed_comic = comic_parser.load_matches(filename, matches)
+    streaming_seconds = time.perf_counter() - start
+
+    print("plain:     %8d bytes %.3fs" % (len(content), plain_seconds))
+    print("streaming: %8d bytes %.3fs" % (bytes_read, streaming_seconds))
+    if comic != streamed_comic:
+        print("Comics differ:\n  %r\n  %r" % (comic, streamed_comic))
+
+
+def check(chunk_size=1024):
+    ## Streams each of CHECK_LAYOUTS and compares it with a plain parse; returning the number that differ.
+    comic_parser = ComicParser(CHECK_COMIC_INFO)
+    failures = 0
+    for name, html in sorted(CHECK_LAYOUTS.items()):
+        content = html.encode('utf-8')
+        comic = comic_parser.load_comic('http://example.com/p/1', html)
+        matches, bytes_read = stream_content(content, comic_parser, chunk_size)
+        streamed_comic = comic_parser.load_matches('http://example.com/p/1', matches)
+        if comic == streamed_comic:
+            print("ok    %-28s read %d of %d bytes" % (name, bytes_read, len(content)))
+        else:
+            failures += 1
+            print("FAIL  %-28s\n  plain:     %r\n  streaming: %r" % (name, comic, streamed_comic))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare plain and streaming parsing of a saved comic page.')
+    parser.add_argument('page', nargs='?')
+    parser.add_argument('base', nargs='?', help='Preset to parse the page with.')
+    parser.add_argument('--config', default='comics.yaml')
+    parser.add_argument('--check', action='store_true', help='Check the streaming parser against known page layouts instead.')
+    args = parser.parse_args()
+    if args.check:
+        sys.exit(1 if check() else 0)
+    if not args.page or not args.base:
+        parser.error('page and base are required unless --check is given.')
+    with open(args.config) as f:
+        comics_data = load_yaml(f)
+    compare(args.page, {'base': args.base}, comics_data.get('presets', {}), comics_data.get('mixins', {}))
+
+
+if __name__ == '__main__':
+    main()
@@ -12,6 +12,7 @@ with open('HISTORY.rst') as history_file:
 requirements = [
     'aiohttp',
     'beautifulsoup4',
+    'soupsieve',
     'PyYAML',
     'jinja2'
 ]
@@ -37,6 +38,8 @@ setup(
     entry_points={
         'console_scripts': [
             'dl_comic = comic.core:main',
+            'comic_pack = comic.archive:main',
+            'comic_server = comic.server:main',
         ],
     },
     include_package_data=True,